@@ -42,13 +42,37 @@ print(f"[INFO] Project directory successfully set to: '{PROJECT_DIRECTORY}'")
 
 import json
 import socket
+import struct
 import csv
 import hashlib
 import shutil
 import time
+import uuid
+import threading
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
 import itasca
 from itasca import ball, wall
 
+# orjson is much faster for the large multi-step results; fall back to the
+# standard library when it is not installed in PFC's Python. Both helpers
+# work on UTF-8 bytes.
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    _json_loads = json.loads
+
+# Results are zstd-compressed on the wire when both ends have 'zstandard'.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+ZSTD_LEVEL = 3
+
 # --- Dependency Check ---
 try:
     from utils import (run_dat_file, delete_balls_outside_area, fenceng,
@@ -79,6 +103,36 @@ DEFAULT_CONFIG = {
     ], "SOLVE_CYCLES_PER_STEP": 8000, "SOLVE_RATIO_TARGET": 1e-5
 }
 
+# Results of finished runs are cached on disk by run hash, so a parameter set
+# that has already been simulated is answered without starting PFC again.
+USE_CACHE = True
+CACHE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "_result_cache")
+
+# Also write each step's resampled CSV into the run folder, so the archived
+# experiment keeps it next to the other outputs.
+ARCHIVE_STEP_CSV = True
+
+# Stage one (sample generation) does not depend on the optimized parameters,
+# so its 'yuya.sav' is reused across runs. The key covers the config entries
+# it reads plus the contents of the .dat script.
+USE_SAV_CACHE = True
+SAV_CACHE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "_sav_cache")
+STAGE_ONE_CONFIG_KEYS = ("DETERMINISTIC_MODE",)
+
+# Finished run folders are archived by a background pool. Archives still in
+# progress are tracked by run hash until they finish.
+_ARCHIVE_POOL = ThreadPoolExecutor(max_workers=2)
+_PENDING_ARCHIVES = {}
+# Guards _PENDING_ARCHIVES, which archive callbacks update from pool threads.
+_PENDING_ARCHIVES_LOCK = threading.Lock()
+ARCHIVE_MOVE_ATTEMPTS = 50
+ARCHIVE_RETRY_DELAY = 0.01
+
+# Folders to be deleted are renamed into the trash and removed later by a
+# janitor thread, so a slow recursive delete never blocks an archive.
+TRASH_DIRECTORY = os.path.join(PROJECT_DIRECTORY, "_trash")
+TRASH_SWEEP_INTERVAL = 30.0
+
 # ==============================================================================
 # 1. SIMULATION WORKFLOW FUNCTIONS
 # ==============================================================================
@@ -91,22 +145,54 @@ def setup_temporary_environment(base_path, run_hash):
         "img": os.path.join(run_path, "img"),
         "csv": os.path.join(run_path, "csv")
     }
-    for path in paths.values():
-        os.makedirs(path, exist_ok=True)
+    # Only the root needs a recursive makedirs; the leaves are single mkdirs.
+    os.makedirs(run_path, exist_ok=True)
+    for key in ("sav", "mat", "img", "csv"):
+        try:
+            os.mkdir(paths[key])
+        except FileExistsError:
+            pass
     return paths
 
-def calculate_geology(config):
-    thicknesses = config["ROCK_LAYER_THICKNESSES"].copy()
+def _layer_geology(thicknesses):
     model_height = sum(thicknesses)
-    thicknesses.reverse()
-    cumulative_heights = [round(sum(thicknesses[:i+1]), 4) for i in range(len(thicknesses))]
+    # Bottom-up running sum in a single pass; the shared list is not mutated.
+    cumulative_heights = tuple(round(h, 4) for h in accumulate(reversed(thicknesses)))
     return cumulative_heights, model_height
 
+# Run configs share the default thickness list, so its geology is computed once.
+_DEFAULT_GEOLOGY = _layer_geology(DEFAULT_CONFIG["ROCK_LAYER_THICKNESSES"])
+
+def calculate_geology(config):
+    thicknesses = config["ROCK_LAYER_THICKNESSES"]
+    if thicknesses is DEFAULT_CONFIG["ROCK_LAYER_THICKNESSES"]:
+        return _DEFAULT_GEOLOGY
+    return _layer_geology(thicknesses)
+
+def _stage_one_hash(config, dat_path):
+    with open(dat_path, 'rb') as f:
+        dat_bytes = f.read()
+    config_subset = {k: config[k] for k in STAGE_ONE_CONFIG_KEYS}
+    key = json.dumps(config_subset, sort_keys=True).encode('utf-8') + dat_bytes
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
 def run_stage_one_generation(config, paths):
+    """Returns the path of the stage one save file that stage two should restore."""
     save_file = os.path.join(paths["root"], "yuya.sav")
+    dat_path = os.path.join(PROJECT_DIRECTORY, "yuya-new.dat")
+
+    cached_save_file = None
+    if USE_SAV_CACHE:
+        cached_save_file = os.path.join(SAV_CACHE_DIRECTORY, _stage_one_hash(config, dat_path), "yuya.sav")
+        if os.path.exists(cached_save_file):
+            # Stage two restores the cached sample directly, which replaces the
+            # whole model, so no 'model new' or copy into the run folder is needed.
+            itasca.set_deterministic(config["DETERMINISTIC_MODE"])
+            print(f"  [Cache] Reusing stage one sample from {cached_save_file}")
+            return cached_save_file
+
     itasca.command("model new")
     itasca.set_deterministic(config["DETERMINISTIC_MODE"])
-    dat_path = os.path.join(PROJECT_DIRECTORY, "yuya-new.dat")
     run_dat_file(dat_path)
     delete_balls_outside_area(
         x_min=wall.find('boxWallLeft4').pos_x(), x_max=wall.find('boxWallRight2').pos_x(),
@@ -114,16 +200,49 @@ def run_stage_one_generation(config, paths):
     )
     itasca.command(f"model save '{save_file}'")
 
-def run_stage_two_equilibrium(config, layer_array, paths):
+    if cached_save_file is not None:
+        # Both servers share the cache, so each writes its own temporary file.
+        tmp_path = f"{cached_save_file}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cached_save_file), exist_ok=True)
+            shutil.copyfile(save_file, tmp_path)
+            os.replace(tmp_path, cached_save_file)
+        except OSError as e:
+            print(f"  [Cache WARN] Could not store stage one sample. Error: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return save_file
+
+def _fish_literal(value):
+    if isinstance(value, str):
+        return f"'{value}'"
+    return repr(value)
+
+def _build_fish_assignment_block(params_list):
+    """
+    Builds one FISH function that assigns every parameter, so all values cross
+    the Python/PFC boundary in a single command instead of one fish.set each.
+    Uses the same 'fish define' form as 'par' in yuya-new.dat.
+    """
+    lines = ["fish define _set_equilibrium_params"]
+    lines.extend(f"    {name} = {_fish_literal(value)}" for name, value in params_list)
+    lines.append("end")
+    lines.append("@_set_equilibrium_params")
+    return "\n".join(lines)
+
+def run_stage_two_equilibrium(config, layer_array, paths, initial_save_file):
     save_file = os.path.join(paths["root"], "jiaojie.sav")
-    initial_save_file = os.path.join(paths["root"], "yuya.sav")
     itasca.command(f"model restore '{initial_save_file}'")
     fenceng(layer_array=layer_array)
     fenceng_temp_file = os.path.join(paths["root"], "fenceng_temp.sav")
     itasca.command(f"model save '{fenceng_temp_file}'")
     itasca.command(f"model restore '{fenceng_temp_file}'")
-    for name, value in config["EQUILIBRIUM_PARAMS_LIST"]:
-        itasca.fish.set(name, value)
+    try:
+        itasca.command(_build_fish_assignment_block(config["EQUILIBRIUM_PARAMS_LIST"]))
+    except Exception as e:
+        print(f"  [WARN] Batched FISH assignment failed, setting values one by one. Error: {e}")
+        for name, value in config["EQUILIBRIUM_PARAMS_LIST"]:
+            itasca.fish.set(name, value)
     dat_path = os.path.join(PROJECT_DIRECTORY, "jiaojie.dat")
     run_dat_file(dat_path)
     itasca.command(f"model save '{save_file}'")
@@ -146,25 +265,24 @@ def run_excavation_and_collect_data(config, paths):
         itasca.command(f"model solve cycle {config['SOLVE_CYCLES_PER_STEP']} or ratio-average {config['SOLVE_RATIO_TARGET']}")
         
         step_name = f"excavation_face_{excavation_end:.2f}"
-        plot_y_displacement_heatmap(
+        # The resampled CSV is returned in memory; writing it to the run
+        # folder for the archive is optional.
+        csv_content = plot_y_displacement_heatmap(
             window_size=itasca.fish.get('rdmax') * 2,
             model_width=config["MODEL_WIDTH"],
             model_height=160,
             name=step_name,
             interpolate='nearest',
-            resu_path=paths["root"]
+            resu_path=paths["root"],
+            return_data=True,
+            save_csv=ARCHIVE_STEP_CSV
         )
-        
-        data_filename = f"resampled_displacement_{step_name}.csv"
-        data_filepath = os.path.join(paths["csv"], data_filename)
 
-        if os.path.exists(data_filepath):
-            with open(data_filepath, 'r') as f:
-                csv_content = f.read()
+        if csv_content:
             all_steps_data[step_key] = csv_content
             print(f"    -> Collected data for {step_key}.")
         else:
-            print(f"    -> [WARN] Data file not found for {step_key} at {data_filepath}")
+            print(f"    -> [WARN] No resampled data was produced for {step_key}.")
             all_steps_data[step_key] = ""
 
     print("  [Sim] Multi-step excavation and data collection complete.")
@@ -173,14 +291,106 @@ def run_excavation_and_collect_data(config, paths):
 # ==============================================================================
 # 2. CORE SIMULATION DRIVER
 # ==============================================================================
+# Scripts whose contents change the results of a run for the same client params.
+RESULT_CACHE_SCRIPTS = ("yuya-new.dat", "jiaojie.dat", "fracture.p2fis", "utils.py")
+_result_cache_fingerprint = None
+
+def _get_result_cache_fingerprint():
+    """Hashes DEFAULT_CONFIG and the model scripts, so edits to either start a fresh cache."""
+    global _result_cache_fingerprint
+    if _result_cache_fingerprint is None:
+        h = hashlib.blake2b(json.dumps(DEFAULT_CONFIG, sort_keys=True, default=str).encode('utf-8'),
+                            digest_size=8)
+        for name in RESULT_CACHE_SCRIPTS:
+            script_path = os.path.join(PROJECT_DIRECTORY, name)
+            if os.path.exists(script_path):
+                with open(script_path, 'rb') as f:
+                    h.update(name.encode('utf-8') + f.read())
+        _result_cache_fingerprint = h.hexdigest()
+    return _result_cache_fingerprint
+
+def _cache_path(run_hash):
+    return os.path.join(CACHE_DIRECTORY, _get_result_cache_fingerprint(), f"{run_hash}.json")
+
+def _save_to_cache(run_hash, results_json_bytes):
+    """Writes the results atomically so a crash never leaves a partial cache file."""
+    cache_path = _cache_path(run_hash)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Both servers share the cache folder, so each writer uses its own temp file.
+    tmp_path = f"{cache_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(results_json_bytes)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _discard_folder(path):
+    try:
+        os.makedirs(TRASH_DIRECTORY, exist_ok=True)
+        os.rename(path, os.path.join(TRASH_DIRECTORY, uuid.uuid4().hex))
+    except OSError:
+        # e.g. the trash is on another drive; delete in place instead.
+        shutil.rmtree(path, ignore_errors=True)
+
+def _trash_janitor():
+    while True:
+        time.sleep(TRASH_SWEEP_INTERVAL)
+        try:
+            entries = list(os.scandir(TRASH_DIRECTORY))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def _archive_run(run_root, run_hash):
+    """Moves a finished run folder into 'experiments', or deletes it if that fails."""
+    try:
+        experiments_dir = os.path.join(PROJECT_DIRECTORY, "experiments")
+        os.makedirs(experiments_dir, exist_ok=True)
+        destination_path = os.path.join(experiments_dir, run_hash)
+        
+        if os.path.exists(destination_path):
+            _discard_folder(destination_path)
+
+        # PFC can hold file handles for a moment after 'model new'; retry the
+        # move briefly instead of always sleeping before it.
+        for _ in range(ARCHIVE_MOVE_ATTEMPTS):
+            try:
+                shutil.move(run_root, destination_path)
+                break
+            except PermissionError:
+                time.sleep(ARCHIVE_RETRY_DELAY)
+        else:
+            raise PermissionError(f"'{run_root}' was still locked after {ARCHIVE_MOVE_ATTEMPTS} attempts.")
+        print(f"  [Archive] Successfully moved results to: {destination_path}")
+    except Exception as e:
+        print(f"  [Archive WARN] Could not archive results folder. Deleting it instead. Error: {e}")
+        _discard_folder(run_root)
+
+def _forget_archive(run_hash, future):
+    """Drops a finished archive from _PENDING_ARCHIVES unless a newer one replaced it."""
+    with _PENDING_ARCHIVES_LOCK:
+        if _PENDING_ARCHIVES.get(run_hash) is future:
+            _PENDING_ARCHIVES.pop(run_hash, None)
+
 def _run_single_optimization_cycle(client_params):
-    itasca.command("python-reset-state true")
+    param_bytes = str(sorted(client_params.items())).encode('utf-8')
+    run_hash = hashlib.blake2b(param_bytes, digest_size=6).hexdigest()
 
-    param_string = str(sorted(client_params.items()))
-    run_hash = hashlib.md5(param_string.encode('utf-8')).hexdigest()[:12]
-    
-    run_config = json.loads(json.dumps(DEFAULT_CONFIG))
-    current_params = dict(run_config["EQUILIBRIUM_PARAMS_LIST"])
+    if USE_CACHE:
+        cache_path = _cache_path(run_hash)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                print(f"  [Cache] Hit for run {run_hash}. Skipping simulation.")
+                return f.read()
+
+    # Only the parameter list is rebuilt per run; every other value is shared
+    # read-only with DEFAULT_CONFIG.
+    run_config = DEFAULT_CONFIG.copy()
+    current_params = dict(DEFAULT_CONFIG["EQUILIBRIUM_PARAMS_LIST"])
     for key, value in client_params.items():
         # The value from client might be a string (e.g., "1.23e+10"),
         # so we convert it to a float for PFC.
@@ -190,6 +400,12 @@ def _run_single_optimization_cycle(client_params):
             current_params[key] = value # Keep as is if conversion fails
     run_config["EQUILIBRIUM_PARAMS_LIST"] = list(current_params.items())
 
+    # A previous run with the same hash may still be moving this folder.
+    with _PENDING_ARCHIVES_LOCK:
+        pending_archive = _PENDING_ARCHIVES.pop(run_hash, None)
+    if pending_archive is not None:
+        pending_archive.result()
+
     temp_base_path = os.path.join(PROJECT_DIRECTORY, "_temp_server_runs")
     paths = setup_temporary_environment(temp_base_path, run_hash)
     
@@ -213,76 +429,161 @@ def _run_single_optimization_cycle(client_params):
     # --- END NEW ---
 
     try:
-        itasca.command("model new")
         layer_array, _ = calculate_geology(run_config)
-        run_stage_one_generation(run_config, paths)
-        run_stage_two_equilibrium(run_config, layer_array, paths)
+        initial_save_file = run_stage_one_generation(run_config, paths)
+        run_stage_two_equilibrium(run_config, layer_array, paths, initial_save_file)
         itasca.command("ball attribute velocity 0 spin 0 displacement 0")
         
         all_steps_data = run_excavation_and_collect_data(run_config, paths)
 
         if all_steps_data:
-            return json.dumps(all_steps_data)
+            results_json_bytes = _json_dumps(all_steps_data)
+            if USE_CACHE:
+                try:
+                    _save_to_cache(run_hash, results_json_bytes)
+                except OSError as e:
+                    print(f"  [Cache WARN] Could not write result cache. Error: {e}")
+            return results_json_bytes
         else:
-            return json.dumps({"error": "No data was collected during simulation."})
+            return _json_dumps({"error": "No data was collected during simulation."})
 
     except Exception as e:
         import traceback
         print(f"\n[FATAL SIMULATION ERROR] Run failed: {e}")
         traceback.print_exc()
-        return json.dumps({"error": f"Simulation failed with exception: {e}"})
+        return _json_dumps({"error": f"Simulation failed with exception: {e}"})
     finally:
         itasca.command("model new")
-        time.sleep(0.5)
-        
-        # Archive the results instead of deleting
-        try:
-            experiments_dir = os.path.join(PROJECT_DIRECTORY, "experiments")
-            os.makedirs(experiments_dir, exist_ok=True)
-            destination_path = os.path.join(experiments_dir, run_hash)
-            
-            if os.path.exists(destination_path):
-                shutil.rmtree(destination_path)
-                
-            shutil.move(paths["root"], destination_path)
-            print(f"  [Archive] Successfully moved results to: {destination_path}")
-        except Exception as e:
-            print(f"  [Archive WARN] Could not archive results folder. Deleting it instead. Error: {e}")
-            shutil.rmtree(paths["root"], ignore_errors=True)
+        # Archiving runs in the background so the next request is not held up
+        # by disk I/O.
+        archive = _ARCHIVE_POOL.submit(_archive_run, paths["root"], run_hash)
+        with _PENDING_ARCHIVES_LOCK:
+            _PENDING_ARCHIVES[run_hash] = archive
+        archive.add_done_callback(lambda future: _forget_archive(run_hash, future))
 
 # ==============================================================================
 # 3. SOCKET SERVER
 # ==============================================================================
+# Every message on the socket is framed as a 4-byte big-endian header followed
+# by the message body (UTF-8 JSON). The top two header bits are flags: the body
+# is zstd-compressed / the sender accepts zstd-compressed replies. The other
+# 30 bits are the body length.
+_FRAME_HEADER = struct.Struct('>I')
+_FLAG_COMPRESSED = 1 << 31
+_FLAG_ACCEPTS_COMPRESSED = 1 << 30
+_FRAME_LENGTH_MASK = _FLAG_ACCEPTS_COMPRESSED - 1
+_MSG_WAITALL = getattr(socket, 'MSG_WAITALL', 0)
+
+def _recv_exact(conn, num_bytes):
+    """Reads exactly num_bytes. Returns None if the peer closed before sending anything."""
+    buffer = bytearray(num_bytes)
+    view = memoryview(buffer)
+    # A blocking socket fills the whole buffer in one call with MSG_WAITALL.
+    # Sockets with a timeout are non-blocking underneath, and Windows rejects
+    # the flag there, so they keep the plain loop.
+    flags = _MSG_WAITALL if conn.gettimeout() is None else 0
+    received = 0
+    while received < num_bytes:
+        n = conn.recv_into(view[received:], num_bytes - received, flags)
+        if n == 0:
+            if received == 0:
+                return None
+            raise ConnectionError(f"Connection closed after {received} of {num_bytes} bytes.")
+        received += n
+    return buffer
+
+def _recv_framed(conn):
+    """Returns (payload, peer_accepts_compressed). payload is None if the peer closed."""
+    header = _recv_exact(conn, _FRAME_HEADER.size)
+    if header is None:
+        return None, False
+    (word,) = _FRAME_HEADER.unpack(header)
+    length = word & _FRAME_LENGTH_MASK
+    payload = _recv_exact(conn, length)
+    if payload is None and length > 0:
+        raise ConnectionError("Connection closed before the message body was received.")
+    if word & _FLAG_COMPRESSED:
+        if zstandard is None:
+            raise ConnectionError("Received a zstd-compressed message but 'zstandard' is not installed.")
+        try:
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        except zstandard.ZstdError as e:
+            # The frame was read completely, so the stream is still in sync.
+            raise ValueError(f"Could not decompress message: {e}") from e
+    return payload, bool(word & _FLAG_ACCEPTS_COMPRESSED)
+
+def _send_framed(conn, payload, compress=False):
+    """Sends one message, compressed with zstd if requested and available."""
+    flags = 0
+    if zstandard is not None:
+        flags |= _FLAG_ACCEPTS_COMPRESSED
+        if compress:
+            payload = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+            flags |= _FLAG_COMPRESSED
+    if len(payload) > _FRAME_LENGTH_MASK:
+        raise ValueError(f"Message of {len(payload)} bytes is too large to frame.")
+    conn.sendall(_FRAME_HEADER.pack(len(payload) | flags) + payload)
+
+# Responses can be many megabytes: large buffers let them stream without
+# kernel back-pressure, and TCP_NODELAY stops Nagle from holding back the tail.
+SOCKET_BUFFER_SIZE = 4 << 20
+
+def _tune_socket(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
 def start_server(host='127.0.0.1', port=50002):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    _tune_socket(server_socket)
     
+    # This is a session-wide setting, so it is applied once here rather than
+    # at the start of every simulation cycle.
+    itasca.command("python-reset-state true")
+    threading.Thread(target=_trash_janitor, name="trash-janitor", daemon=True).start()
+
     try:
         server_socket.bind((host, port))
         server_socket.listen()
         print("\n" + "="*70)
         print(f" PFC Multi-Step Optimization Server is RUNNING on {host}:{port}")
         print(" -> Archiving of experiment results is ENABLED.")
+        print(" -> Client connections are kept open between requests.")
         print("="*70)
         
         while True:
             print("\n[Server] Waiting for a client connection...")
             conn, addr = server_socket.accept()
             print(f"[Server] Accepted connection from {addr}")
+            _tune_socket(conn)
+            # The connection stays open for any number of requests, so an
+            # optimizer can reuse one socket for its whole run. It ends when the
+            # client closes it or sends {"cmd": "quit"}.
             with conn:
-                data = conn.recv(8192)
-                if not data:
-                    print("[Server] Connection closed by client without data.")
-                    continue
-
-                client_params = json.loads(data.decode('utf-8'))
-                print(f"[Server] Received parameters: {client_params}")
-                
-                results_json_string = _run_single_optimization_cycle(client_params)
-                
-                print("[Server] Simulation cycle finished. Sending multi-step JSON results...")
-                conn.sendall(results_json_string.encode('utf-8'))
-                print("[Server] Results sent. Closing connection.")
+                try:
+                    while True:
+                        data, client_accepts_zstd = _recv_framed(conn)
+                        if not data:
+                            print("[Server] Connection closed by client.")
+                            break
+
+                        client_params = _json_loads(data)
+                        if client_params.get("cmd") == "quit":
+                            print("[Server] Client requested to close the connection.")
+                            break
+                        print(f"[Server] Received parameters: {client_params}")
+
+                        results_json_bytes = _run_single_optimization_cycle(client_params)
+
+                        print("[Server] Simulation cycle finished. Sending multi-step JSON results...")
+                        _send_framed(conn, results_json_bytes, compress=client_accepts_zstd)
+                        print("[Server] Results sent. Waiting for the next request on this connection...")
+                except (ConnectionError, socket.timeout) as e:
+                    print(f"[Server WARN] Connection with {addr} lost: {e}")
+                except ValueError as e:
+                    # Undecodable request (bad zstd frame or JSON); drop only this client.
+                    print(f"[Server WARN] Bad request from {addr}, closing the connection: {e}")
 
     except Exception as e:
         print(f"[Server FATAL ERROR] An error in the server loop forced shutdown: {e}")
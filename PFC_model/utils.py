@@ -3,6 +3,7 @@ from itasca import ball, wall, ballarray
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import io
 import csv
 import traceback
 from scipy.interpolate import griddata
@@ -231,10 +232,16 @@ def get_balls_y_displacement_matrix(window_size, model_width, model_height, inte
     return displacement_matrix, x_centers, y_centers
 
 # Example usage and plotting:
-def plot_y_displacement_heatmap(window_size, model_width, model_height, name, interpolate='nearest', resu_path=".", overlap=0.5):
+def plot_y_displacement_heatmap(window_size, model_width, model_height, name, interpolate='nearest', resu_path=".", overlap=0.5,
+                                return_data=False, save_csv=True):
     """
     Create, plot, and save the displacement heatmap and resampled CSV data.
+
+    If return_data is True, the resampled CSV text is also returned (None if it
+    could not be created), so callers in the same process do not need to read
+    the file back. Set save_csv to False to skip writing the CSV file.
     """
+    csv_text = None
     
     # --- Part 1: Original Heatmap Generation ---
     disp_matrix, x_centers, y_centers = get_balls_y_displacement_matrix(
@@ -289,15 +296,20 @@ def plot_y_displacement_heatmap(window_size, model_width, model_height, name, in
             print("INFO: Interpolation complete.")
 
 
-            csv_path = os.path.join(resu_path, 'csv', f'resampled_displacement_{name}.csv')
-            with open(csv_path, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Y_Coordinate'] + list(target_x))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(['Y_Coordinate'] + list(target_x))
+
+            for i in range(num_points_y):
+                row = [target_y[i]] + list(resampled_grid[i, :])
+                writer.writerow(row)
+            csv_text = buffer.getvalue()
 
-                for i in range(num_points_y):
-                    row = [target_y[i]] + list(resampled_grid[i, :])
-                    writer.writerow(row)
-            print(f"SUCCESS: Resampled displacement data saved to '{csv_path}'")
+            if save_csv:
+                csv_path = os.path.join(resu_path, 'csv', f'resampled_displacement_{name}.csv')
+                with open(csv_path, 'w', newline='') as f:
+                    f.write(csv_text)
+                print(f"SUCCESS: Resampled displacement data saved to '{csv_path}'")
         else:
             print("WARNING: No valid data points in disp_matrix to create a CSV file.")
 
@@ -306,6 +318,9 @@ def plot_y_displacement_heatmap(window_size, model_width, model_height, name, in
 
         traceback.print_exc()
 
+    if return_data:
+        return csv_text
+
 
 def fenceng(layer_array):
     """
@@ -1,52 +1,175 @@
 # -*- coding: utf-8 -*-
 """
 Knowledge Base Manager for the Multi-Step Mining Optimization.
-This version stores and retrieves the full JSON object containing all step data.
+Each knowledge base file holds the parameters as JSON on its first line,
+followed by the multi-step JSON string exactly as received from the server.
 
 REVISION 2: Fixed a TypeError by converting string parameters from the
             knowledge base back to floats before feeding them to the optimizer.
+REVISION 3: Parameter hashes now use BLAKE2b. Files named by the old
+            SHA-256 hash are still found on lookup.
+REVISION 4: Files are stored as a parameters line plus the raw simulation
+            JSON, so saving and loading no longer re-parse the step data.
+            Files in the old single-object format are still read.
+REVISION 5: New files are zstd-compressed ('.json.zst') when the optional
+            'zstandard' package is installed.
+REVISION 6: Lookups are remembered in an in-memory LRU (file path, or a
+            miss), and files are written atomically through a temporary file.
+REVISION 7: Per-lookup messages go through 'logging' instead of print.
 """
 import os
 import json
 import hashlib
+import logging
+import operator
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from loss_function import calculate_multi_step_loss
 
+# orjson is much faster for the large CSV-carrying payloads; the standard
+# library is used when it is not installed. Both helpers work on UTF-8 bytes.
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    _json_loads = json.loads
+
+# With 'zstandard' installed, new files are stored zstd-compressed as
+# '{hash}.json.zst'; plain '.json' files are always readable.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+ZSTD_LEVEL = 3
+
+logger = logging.getLogger('pfc.kb')
+
 KNOWLEDGE_BASE_DIR = "knowledge_base_mining"
+KB_SCAN_WORKERS = 8
+# File paths found by recent lookups, keyed by the encoded parameters; None
+# marks a known miss. Only paths are kept, never the (multi-MB) payloads.
+KB_LOOKUP_CACHE_SIZE = 4096
+_lookup_cache = OrderedDict()
+_lookup_lock = threading.Lock()
 
 def ensure_kb_directory():
     os.makedirs(KNOWLEDGE_BASE_DIR, exist_ok=True)
 
-def get_params_hash(params_dict):
+def _encode_params(params_dict):
     # This function expects native python types or string-formatted numbers.
     # The conversion is handled in the main client script.
-    sorted_params_str = json.dumps(params_dict, sort_keys=True)
-    return hashlib.sha256(sorted_params_str.encode('utf-8')).hexdigest()
+    return json.dumps(params_dict, sort_keys=True).encode('utf-8')
+
+def get_params_hash(params_dict, encoded_params=None):
+    if encoded_params is None:
+        encoded_params = _encode_params(params_dict)
+    return hashlib.blake2b(encoded_params, digest_size=16).hexdigest()
+
+def get_legacy_params_hash(params_dict, encoded_params=None):
+    """SHA-256 hash that named knowledge base files before the switch to BLAKE2b."""
+    if encoded_params is None:
+        encoded_params = _encode_params(params_dict)
+    return hashlib.sha256(encoded_params).hexdigest()
+
+def _kb_suffixes():
+    # Compressed files can only be read when 'zstandard' is installed.
+    return (".json.zst", ".json") if zstandard is not None else (".json",)
+
+def _read_kb_file(filepath):
+    """
+    Returns (parameters dict, multi-step JSON string) from a knowledge base file.
+    Only the parameters line is parsed; the simulation JSON is returned as is.
+    """
+    with open(filepath, 'rb') as f:
+        content = f.read()
+    if filepath.endswith(".zst"):
+        try:
+            content = zstandard.ZstdDecompressor().decompress(content)
+        except zstandard.ZstdError as e:
+            # Truncated or corrupt file; reported like any other malformed file.
+            raise ValueError(f"Could not decompress '{filepath}': {e}") from e
+    params_line, _, sim_part = content.partition(b'\n')
+    try:
+        return _json_loads(params_line), sim_part.decode('utf-8')
+    except ValueError:
+        # Old format: one indented object with 'parameters' and 'simulation_data'.
+        data = _json_loads(content)
+        return data['parameters'], _json_dumps(data.get('simulation_data')).decode('utf-8')
+
+def _remember_lookup(encoded_params, filepath):
+    with _lookup_lock:
+        _lookup_cache[encoded_params] = filepath
+        _lookup_cache.move_to_end(encoded_params)
+        if len(_lookup_cache) > KB_LOOKUP_CACHE_SIZE:
+            _lookup_cache.popitem(last=False)
 
 def save_to_knowledge_base(params_dict, sim_steps_json_string):
     """Saves the parameters (with string-formatted numbers) and the resulting multi-step JSON data."""
-    param_hash = get_params_hash(params_dict)
+    encoded_params = _encode_params(params_dict)
+    param_hash = get_params_hash(params_dict, encoded_params)
+    content = _json_dumps(params_dict) + b'\n' + sim_steps_json_string.encode('utf-8')
     filepath = os.path.join(KNOWLEDGE_BASE_DIR, f"{param_hash}.json")
-    
-    data_to_save = {
-        'parameters': params_dict,
-        'simulation_data': json.loads(sim_steps_json_string)
-    }
-    
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data_to_save, f, indent=2)
-    print(f"  -> Result saved to knowledge base: {param_hash[:10]}...")
+    if zstandard is not None:
+        filepath += ".zst"
+        content = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(content)
+
+    # Write to a private temporary file and rename it into place, so a reader
+    # (or another worker saving the same point) never sees a partial file.
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, filepath)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # A remembered miss for these parameters is no longer valid.
+    with _lookup_lock:
+        _lookup_cache.pop(encoded_params, None)
+    logger.info("  -> Result saved to knowledge base: %s...", param_hash[:10])
 
 def load_from_knowledge_base(params_dict):
     """
     Tries to load a result. Returns the multi-step JSON string if found, else None.
+    Files saved under the legacy SHA-256 name or without compression are still found.
     """
-    param_hash = get_params_hash(params_dict)
-    filepath = os.path.join(KNOWLEDGE_BASE_DIR, f"{param_hash}.json")
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"  -> Cache hit! Loaded result from knowledge base: {param_hash[:10]}...")
-        return json.dumps(data.get('simulation_data'))
+    encoded_params = _encode_params(params_dict)
+    with _lookup_lock:
+        known = encoded_params in _lookup_cache
+        if known:
+            _lookup_cache.move_to_end(encoded_params)
+            filepath = _lookup_cache[encoded_params]
+    if known:
+        if filepath is None:
+            return None
+        try:
+            _, sim_steps_json_string = _read_kb_file(filepath)
+            logger.info("  -> Cache hit! Loaded result from knowledge base: %s...", os.path.basename(filepath)[:10])
+            return sim_steps_json_string
+        except (OSError, ValueError):
+            # The file went away or is unreadable; fall through to a full lookup.
+            pass
+
+    for param_hash in (get_params_hash(params_dict, encoded_params),
+                       get_legacy_params_hash(params_dict, encoded_params)):
+        for suffix in _kb_suffixes():
+            filepath = os.path.join(KNOWLEDGE_BASE_DIR, param_hash + suffix)
+            if os.path.exists(filepath):
+                try:
+                    _, sim_steps_json_string = _read_kb_file(filepath)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning("  -> Skipping unreadable knowledge base file '%s': %s", filepath, e)
+                    continue
+                logger.info("  -> Cache hit! Loaded result from knowledge base: %s...", param_hash[:10])
+                _remember_lookup(encoded_params, filepath)
+                return sim_steps_json_string
+    _remember_lookup(encoded_params, None)
     return None
 
 def warm_start_optimizer(parameter_space, target_data_dir, target_transform, sim_transform, step_weights):
@@ -56,39 +179,46 @@ def warm_start_optimizer(parameter_space, target_data_dir, target_transform, sim
     """
     print("\n--- Initializing Optimizer with Prior Knowledge ---")
     ensure_kb_directory()
-    x0_prior, y0_prior = [], []
-    param_names = [p.name for p in parameter_space]
-    kb_files = [f for f in os.listdir(KNOWLEDGE_BASE_DIR) if f.endswith(".json")]
+    param_names = tuple(p.name for p in parameter_space)
+    # Fetches all parameter values in one C-level call; a file from a different
+    # parameter space raises KeyError and is skipped.
+    _get_values = operator.itemgetter(*param_names)
+    get_values = _get_values if len(param_names) > 1 else (lambda d: (_get_values(d),))
+    kb_entries = [e for e in os.scandir(KNOWLEDGE_BASE_DIR) if e.name.endswith(_kb_suffixes())]
 
-    if not kb_files:
+    if not kb_entries:
         print("No prior knowledge found. Starting with random exploration.")
         return [], []
 
-    for i, filename in enumerate(kb_files):
-        print(f"  Processing prior point {i+1}/{len(kb_files)}...", end='\r')
-        filepath = os.path.join(KNOWLEDGE_BASE_DIR, filename)
+    def _score_one(entry):
+        """Returns (params_list, loss) for one knowledge base file, or None if unusable."""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            params_dict = data['parameters']
+            params_dict, sim_steps_json_string = _read_kb_file(entry.path)
+            if not sim_steps_json_string:
+                return None
             
             # --- FIX: Convert all parameter values back to float for skopt ---
             # This prevents the TypeError during the optimizer.tell() call.
-            params_list = [float(params_dict.get(name)) for name in param_names]
+            params_list = list(map(float, get_values(params_dict)))
             # --- END FIX ---
-            
-            sim_steps_json_string = json.dumps(data.get('simulation_data'))
-            
-            if sim_steps_json_string and all(p is not None for p in params_list):
-                loss = calculate_multi_step_loss(
-                    target_data_dir, sim_steps_json_string, target_transform, sim_transform, step_weights
-                )
-                if loss < 1e9:
-                    x0_prior.append(params_list)
-                    y0_prior.append(loss)
-        except Exception:
-            continue
+        except (OSError, ValueError, KeyError, TypeError):
+            # Unreadable or malformed file.
+            return None
+
+        # Files are already scored in parallel, so each one scores its steps serially.
+        loss = calculate_multi_step_loss(
+            target_data_dir, sim_steps_json_string, target_transform, sim_transform, step_weights,
+            parallel=False
+        )
+        return (params_list, loss) if loss < 1e9 else None
+
+    # Files are independent, so reading and scoring them is spread over a
+    # thread pool; NumPy/SciPy release the GIL for most of the loss work.
+    print(f"  Processing {len(kb_entries)} prior points...")
+    with ThreadPoolExecutor(max_workers=KB_SCAN_WORKERS) as executor:
+        results = [r for r in executor.map(_score_one, kb_entries) if r is not None]
+    x0_prior = [params_list for params_list, _ in results]
+    y0_prior = [loss for _, loss in results]
 
     print(f"\nLoaded and processed {len(x0_prior)} valid prior data points.")
     return x0_prior, y0_prior
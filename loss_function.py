@@ -10,70 +10,280 @@ of incomplete experimental data sets.
 import os
 import io
 import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 import numpy as np
-import pandas as pd
-from scipy.interpolate import griddata
+from scipy.sparse import csr_matrix
+from scipy.spatial import Delaunay
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('pfc.loss')
+
+# Score the steps of one simulation on a thread pool shared by all callers,
+# so concurrent loss evaluations never add more than one pool of threads.
+# Callers that already run many evaluations in parallel (the knowledge base
+# warm start) pass parallel=False instead.
+PARALLEL_LOSS = True
+_step_pool = None
+_step_pool_lock = threading.Lock()
+
+def _get_step_pool():
+    global _step_pool
+    with _step_pool_lock:
+        if _step_pool is None:
+            _step_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='loss-step')
+        return _step_pool
+
+# Numba is optional; without it the sparse matrix path below is used.
+try:
+    from numba import njit, types as nb_types
+except ImportError:
+    njit = None
+
+class _LRUCache:
+    """Small thread-safe LRU mapping for the interpolation caches below."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+# Linear interpolation from a simulation grid onto a target grid, in one of two
+# forms: dense per-target-point vertex indices and barycentric weights (index
+# -1 for points outside the triangulation) for the Numba kernel, or otherwise
+# a sparse (n_target, n_sim) matrix. When the simulation grid holds exactly the target points,
+# the interpolation is an identity and only `order` is set: the sim value index
+# for each target point, or slice(None) when both grids share the same order.
+_Interpolation = namedtuple('_Interpolation', ['matrix', 'vertex_idx', 'weights', 'order'],
+                            defaults=(None,))
+
+# Tolerance for treating simulation and target points as the same grid.
+SAME_GRID_ATOL = 1e-6
+
+# Interpolations from a simulation grid onto a target grid. These only repeat
+# when a later result has the same grid for a step (the resampling window is
+# fixed) or when the grids coincide with the targets, so the cache holds about
+# one result's worth of steps.
+INTERPOLATION_CACHE_SIZE = 16
+_interpolation_cache = _LRUCache(maxsize=INTERPOLATION_CACHE_SIZE)
+
+if njit is not None:
+    # nogil rather than parallel: steps and knowledge base files are already
+    # scored from several threads, and one target grid is only ~40k points.
+    # With an explicit signature the kernel is compiled (or loaded from the
+    # on-disk cache) at import time instead of inside the first loss call.
+    # Target values are the read-only arrays from _load_target.
+    _RMSE_SIGNATURE = nb_types.float64(
+        nb_types.Array(nb_types.int64, 2, 'C'),
+        nb_types.Array(nb_types.float64, 2, 'C'),
+        nb_types.Array(nb_types.float32, 1, 'A'),
+        nb_types.Array(nb_types.float32, 1, 'A', readonly=True),
+        nb_types.float64,
+    )
+
+    @njit(_RMSE_SIGNATURE, cache=True, nogil=True)
+    def _rmse_from_weights(vertex_idx, weights, sim_values, target_values, sim_scale):
+        n_target, n_vertices = vertex_idx.shape
+        total = 0.0
+        for i in range(n_target):
+            aligned = 0.0
+            if vertex_idx[i, 0] >= 0:
+                for k in range(n_vertices):
+                    aligned += weights[i, k] * sim_values[vertex_idx[i, k]]
+            diff = target_values[i] - aligned * sim_scale
+            total += diff * diff
+        return np.sqrt(total / n_target)
+
+def _read_displacement_matrix(data_source):
+    """
+    Reads a displacement CSV (header row of X coordinates, then one row per Y
+    coordinate) into (xs, ys, values) NumPy arrays.
+    """
+    if isinstance(data_source, (str, os.PathLike)):
+        with open(data_source, 'r', encoding='utf-8') as f:
+            return _read_displacement_matrix(f)
+    header = data_source.readline().strip().split(',')
+    xs = np.array(header[1:], dtype=np.float64)
+    data = np.loadtxt(data_source, delimiter=',', ndmin=2, dtype=np.float64)
+    return xs, data[:, 0], data[:, 1:]
 
 def _process_displacement_data(data_source, x_shift=0, y_shift=0, x_scale=1, y_scale=1):
     """
-    Internal helper to read, transform, and normalize displacement data.
+    Internal helper to read and transform displacement data.
+    Returns (points, values, scale); values * scale are the values normalized
+    by their maximum absolute value.
     """
     try:
-        data_matrix = pd.read_csv(data_source, index_col=0)
-        data_melted = data_matrix.melt(var_name='X_m', value_name='Displacement', ignore_index=False).reset_index()
-        data_melted['X_m'] = data_melted['X_m'].astype(float)
-        data_melted.rename(columns={data_melted.columns[0]: 'Y_m'}, inplace=True)
+        xs, ys, data_matrix = _read_displacement_matrix(data_source)
 
-        points = data_melted[['X_m', 'Y_m']].values
-        values = data_melted['Displacement'].values
+        # Column-major order (all Y for the first X, then the next X, ...),
+        # the same point order the previous DataFrame.melt produced. The grid
+        # ticks are broadcast straight into one preallocated (n, 2) array.
+        points = np.empty((len(xs) * len(ys), 2))
+        grid = points.reshape(len(xs), len(ys), 2)
+        grid[:, :, 0] = xs[:, None]
+        grid[:, :, 1] = ys[None, :]
+        # Normalized displacements are kept in float32, which halves the memory
+        # traffic of the interpolation; the RMSE still accumulates in float64.
+        # Points stay float64 for the triangulation.
+        values = data_matrix.T.astype(np.float32, order='C').ravel()
 
         if x_scale != 1 or y_scale != 1:
-            points[:, 0] *= x_scale
-            points[:, 1] *= y_scale
+            points *= (x_scale, y_scale)
         if x_shift != 0 or y_shift != 0:
-            points[:, 0] += x_shift
-            points[:, 1] += y_shift
+            points += (x_shift, y_shift)
 
-        max_abs_val = np.max(np.abs(values))
-        normalized_values = values / max_abs_val if max_abs_val > 1e-9 else values
-        return points, normalized_values
+        max_abs_val = float(np.max(np.abs(values)))
+        scale = 1.0 / max_abs_val if max_abs_val > 1e-9 else 1.0
+        return points, values, scale
     except Exception as e:
-        print(f"  [Loss Helper ERROR] Failed to process data source: {e}")
-        return None, None
+        logger.error("[Loss Helper ERROR] Failed to process data source: %s", e)
+        return None, None, None
 
-def _calculate_single_step_loss(target_field_path, sim_field_csv_string, target_transform, sim_transform):
+@lru_cache(maxsize=None)
+def _load_target(target_field_path, mtime, **target_transform):
     """
-    Calculates the RMSE loss for a single step of the simulation.
+    Processes a target file once per (path, modification time, transform).
+    The target data is fixed for a whole optimization, so every later step and
+    trial reuses the cached, read-only arrays.
     """
-    target_points, target_norm_values = _process_displacement_data(
+    target_points, target_values, target_scale = _process_displacement_data(
         target_field_path, **target_transform
     )
     if target_points is None:
         raise ValueError(f"Failed to process target file: {target_field_path}")
+    # Targets are normalized once here; simulation values keep their raw
+    # values and the scale is applied to the interpolated values instead.
+    target_norm_values = target_values * np.float32(target_scale)
+    target_points.setflags(write=False)
+    target_norm_values.setflags(write=False)
+    return target_points, target_norm_values
+
+def _grid_key(points):
+    return (points.shape, hashlib.blake2b(points.tobytes(), digest_size=16).digest())
+
+def _same_grid_order(sim_points, target_points):
+    """
+    Returns the order that aligns sim_points with target_points if both hold
+    the same points (possibly in a different order), else None.
+    """
+    if sim_points.shape != target_points.shape:
+        return None
+    if np.allclose(sim_points, target_points, rtol=0, atol=SAME_GRID_ATOL):
+        return slice(None)
+    sim_sort = np.lexsort(sim_points.T[::-1])
+    target_sort = np.lexsort(target_points.T[::-1])
+    if not np.allclose(sim_points[sim_sort], target_points[target_sort], rtol=0, atol=SAME_GRID_ATOL):
+        return None
+    order = np.empty_like(sim_sort)
+    order[target_sort] = sim_sort
+    return order
+
+def _get_interpolation(sim_points, target_points, target_key):
+    """
+    Returns the _Interpolation of the barycentric weights, equivalent to
+    griddata(sim_points, sim_values, target_points, method='linear',
+    fill_value=0). Target points outside the triangulation get no weights,
+    which gives the fill value of 0.
+    """
+    grid_key = _grid_key(sim_points)
+    cache_key = (grid_key, target_key)
+    interpolation = _interpolation_cache.get(cache_key)
+    if interpolation is not None:
+        return interpolation
+
+    order = _same_grid_order(sim_points, target_points)
+    if order is not None:
+        interpolation = _Interpolation(None, None, None, order)
+        _interpolation_cache.put(cache_key, interpolation)
+        return interpolation
+
+    tri = Delaunay(sim_points)
+    ndim = tri.ndim
+    simplex_idx = tri.find_simplex(target_points)
+    inside = np.nonzero(simplex_idx >= 0)[0]
+    simplex_idx = simplex_idx[inside]
+
+    T = tri.transform[simplex_idx]
+    bary = np.einsum('ijk,ik->ij', T[:, :ndim], target_points[inside] - T[:, ndim])
+    weights = np.column_stack([bary, 1.0 - bary.sum(axis=1)])
+
+    vertices = tri.simplices[simplex_idx].astype(np.int64)
+    # Only the form used by _calculate_single_step_loss is built.
+    if njit is not None:
+        vertex_idx = np.full((len(target_points), ndim + 1), -1, dtype=np.int64)
+        vertex_idx[inside] = vertices
+        dense_weights = np.zeros((len(target_points), ndim + 1))
+        dense_weights[inside] = weights
+        interpolation = _Interpolation(None, vertex_idx, dense_weights)
+    else:
+        rows = np.repeat(inside, ndim + 1)
+        W = csr_matrix((weights.ravel(), (rows, vertices.ravel())), shape=(len(target_points), len(sim_points)))
+        interpolation = _Interpolation(W, None, None)
+    _interpolation_cache.put(cache_key, interpolation)
+    return interpolation
+
+def _calculate_single_step_loss(target_field_path, sim_field_csv_string, target_transform, sim_transform,
+                                target_mtime=None):
+    """
+    Calculates the RMSE loss for a single step of the simulation.
+    """
+    if target_mtime is None:
+        target_mtime = os.path.getmtime(target_field_path)
+    target_key = (target_field_path, target_mtime, tuple(sorted(target_transform.items())))
+    target_points, target_norm_values = _load_target(
+        target_key[0], target_key[1], **target_transform
+    )
 
     sim_data_buffer = io.StringIO(sim_field_csv_string)
-    sim_points, sim_norm_values = _process_displacement_data(
+    sim_points, sim_values, sim_scale = _process_displacement_data(
         sim_data_buffer, **sim_transform
     )
     if sim_points is None:
         raise ValueError("Failed to process simulation data string.")
 
-    sim_norm_values_aligned = griddata(
-        points=sim_points,
-        values=sim_norm_values,
-        xi=target_points,
-        method='linear',
-        fill_value=0
-    )
+    # The interpolation weights are only computed once per (simulation grid,
+    # target) pair.
+    interpolation = _get_interpolation(sim_points, target_points, target_key)
+    if interpolation.order is not None:
+        diff = target_norm_values - sim_values[interpolation.order].astype(np.float64) * sim_scale
+        return np.sqrt(np.mean(diff**2))
+    if njit is not None:
+        return _rmse_from_weights(
+            interpolation.vertex_idx, interpolation.weights, sim_values, target_norm_values, sim_scale
+        )
 
+    # Linear interpolation as a sparse matrix-vector product; the simulation
+    # scale is applied to the interpolated result.
+    sim_norm_values_aligned = (interpolation.matrix @ sim_values) * sim_scale
     return np.sqrt(np.mean((target_norm_values - sim_norm_values_aligned)**2))
 
 def calculate_multi_step_loss(target_data_dir, sim_steps_json_string,
-                              target_transform=None, sim_transform=None, step_weights=None):
+                              target_transform=None, sim_transform=None, step_weights=None,
+                              parallel=None):
     """
     Calculates a total, weighted loss across multiple excavation steps,
-    robustly handling missing target data files.
+    robustly handling missing target data files. Steps are scored on the shared
+    thread pool when `parallel` (default: PARALLEL_LOSS) is true.
     """
+    if parallel is None:
+        parallel = PARALLEL_LOSS
     try:
         sim_steps_data = json.loads(sim_steps_json_string)
         sim_steps_keys = sorted(sim_steps_data.keys())
@@ -83,47 +293,62 @@ def calculate_multi_step_loss(target_data_dir, sim_steps_json_string,
         target_params = target_transform if target_transform else {}
         sim_params = sim_transform if sim_transform else {}
         
-        print(f"  [Loss] Comparing {len(sim_steps_keys)} simulation steps...")
+        logger.debug("[Loss] Comparing %d simulation steps...", len(sim_steps_keys))
+
+        # One directory scan instead of an existence check per step.
+        with os.scandir(target_data_dir) as entries:
+            available_targets = {entry.name: entry for entry in entries if entry.is_file()}
 
+        tasks = []
         for step_key in sim_steps_keys:
             # Construct the expected target filename based on the simulation step key
             # Example: sim_key 'step_3' -> target_filename 'step_3.csv'
             target_filename = f"{step_key}.csv"
-            target_file_path = os.path.join(target_data_dir, target_filename)
+            target_entry = available_targets.get(target_filename)
 
             # --- KEY IMPROVEMENT: Check if the target file exists ---
-            if os.path.exists(target_file_path):
-                print(f"    -> Found target '{target_filename}'. Calculating loss for {step_key}...")
+            if target_entry is not None:
+                logger.debug("  -> Found target '%s'. Calculating loss for %s...", target_filename, step_key)
                 
                 sim_csv_string = sim_steps_data[step_key]
                 if not sim_csv_string:
-                    print(f"    -> [WARN] Simulation data for {step_key} is empty. Skipping.")
+                    logger.warning("  -> Simulation data for %s is empty. Skipping.", step_key)
                     continue
 
-                step_loss = _calculate_single_step_loss(
-                    target_file_path, sim_csv_string, target_params, sim_params
-                )
+                tasks.append((step_key, target_entry.path, target_entry.stat().st_mtime, sim_csv_string))
+            else:
+                # If the target file doesn't exist, just log a message and skip it
+                logger.debug("  -> Target '%s' not found. Skipping step %s.", target_filename, step_key)
 
-                if np.isnan(step_loss):
-                    print(f"    -> [WARN] Loss for {step_key} is NaN. Skipping.")
-                    continue
+        def _step_loss(task):
+            _, target_file_path, target_mtime, sim_csv_string = task
+            return _calculate_single_step_loss(target_file_path, sim_csv_string, target_params, sim_params,
+                                               target_mtime)
 
-                weight = step_weights.get(step_key, 1.0) if step_weights else 1.0
-                total_loss += step_loss * weight
-                total_weight += weight
-                print(f"    -> Step Loss: {step_loss:.6f}, Weight: {weight:.2f}, Weighted Loss Added: {step_loss * weight:.6f}")
-            else:
-                # If the target file doesn't exist, just print a message and skip it
-                print(f"    -> Target '{target_filename}' not found. Skipping step {step_key}.")
+        # Steps are independent; NumPy/SciPy release the GIL for most of the work.
+        if parallel and len(tasks) > 1:
+            step_losses = list(_get_step_pool().map(_step_loss, tasks))
+        else:
+            step_losses = [_step_loss(task) for task in tasks]
+
+        for (step_key, _, _, _), step_loss in zip(tasks, step_losses):
+            if np.isnan(step_loss):
+                logger.warning("  -> Loss for %s is NaN. Skipping.", step_key)
+                continue
+
+            weight = step_weights.get(step_key, 1.0) if step_weights else 1.0
+            total_loss += step_loss * weight
+            total_weight += weight
+            logger.debug("  -> %s Loss: %.6f, Weight: %.2f, Weighted Loss Added: %.6f", step_key, step_loss, weight, step_loss * weight)
 
         # If no steps were compared at all, return a large penalty
         if total_weight == 0:
-            print("  [Loss WARN] No matching target files were found for any simulation step. Returning penalty.")
+            logger.warning("[Loss] No matching target files were found for any simulation step. Returning penalty.")
             return 1e10
         
         # Return the average weighted loss
         return total_loss / total_weight
 
     except Exception as e:
-        print(f"  [Loss ERROR] An unexpected error occurred during multi-step loss calculation: {e}")
+        logger.error("[Loss ERROR] An unexpected error occurred during multi-step loss calculation: %s", e)
         return 1e10
@@ -10,18 +10,38 @@ a corresponding series of target data files.
 
 REVISION 5: Fixed JSONDecodeError by making the response parsing more robust
             to handle potential extra data in the socket stream.
+REVISION 6: The dispatch loop waits on FIRST_COMPLETED, refills all free
+            slots with one batched ask, and also reports the final jobs
+            to the optimizer.
+REVISION 7: Each server is reached over one persistent connection that is
+            reused across jobs. Framed messages make the brace search for
+            the JSON object unnecessary.
+REVISION 8: Per-job progress is reported through 'logging' instead of print.
+REVISION 9: The scheduler hands each job to an idle server instead of strict
+            round robin. A job whose server fails is retried on another
+            server, and a server that keeps failing gets no more jobs.
+REVISION 10: The optimizer is created through surrogates_mining, so the
+             skopt GP can be swapped for Optuna's TPE sampler.
 """
 import os
+import sys
 import json
+import logging
 import socket
-import numpy as np # Import numpy to check for its types
-from skopt import Optimizer
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import zstandard # Optional: compressed server responses
+except ImportError:
+    zstandard = None
 
 # --- Import custom modules for this project ---
 from loss_function import calculate_multi_step_loss
 from utilities_mining import (setup_results_directory, save_best_parameters, plot_convergence)
 from knowledge_base_manager_mining import (warm_start_optimizer, load_from_knowledge_base, save_to_knowledge_base)
+from surrogates_mining import create_surrogate
 
 # =============================================================================
 # --- 1. CONFIGURATION ---
@@ -32,6 +52,12 @@ SERVER_LIST = [
     ('127.0.0.1', 50001),
 ]
 CONNECTION_TIMEOUT = 20000
+# How often a job whose server could not be reached is retried on another server,
+# and after how many consecutive failures a server is given no more jobs.
+JOB_RETRIES = 1
+MAX_SERVER_FAILURES = 3
+SOCKET_BUFFER_SIZE = 4 << 20
+ZSTD_LEVEL = 3
 
 # Target Data Directory
 TARGET_DATA_ROOT_DIR = "target_data"
@@ -39,6 +65,10 @@ TARGET_DATA_ROOT_DIR = "target_data"
 # Bayesian Optimization Settings
 N_CALLS = 50
 N_INITIAL_POINTS = 5
+# 'skopt' (Gaussian process) or 'optuna' (TPE, needs the optional 'optuna' package)
+SURROGATE = 'skopt'
+# Constant-liar strategy used when several points are asked for at once.
+ASK_STRATEGY = 'cl_min'
 
 # Transformation and Weighting for the Loss Function
 SIM_TRANSFORM = {'x_shift': 125, 'y_shift': 80}
@@ -56,80 +86,193 @@ PARAMETER_SPACE = [
     Real(0.2, 0.6, name='key_fric'),
 ]
 
+# Per-job progress goes through logging; raise the level to WARNING to keep it
+# out of the hot path (e.g. when profiling).
+LOG_LEVEL = logging.INFO
+logger = logging.getLogger('pfc.client')
+
 # =============================================================================
 # --- 2. WORKER FUNCTION FOR PARALLEL EXECUTION ---
 # =============================================================================
 
+# Socket messages are framed as a 4-byte big-endian header followed by the
+# message body (UTF-8 JSON). The top two header bits are flags: the body
+# is zstd-compressed / the sender accepts zstd-compressed replies. The other
+# 30 bits are the body length.
+_FRAME_HEADER = struct.Struct('>I')
+_FLAG_COMPRESSED = 1 << 31
+_FLAG_ACCEPTS_COMPRESSED = 1 << 30
+_FRAME_LENGTH_MASK = _FLAG_ACCEPTS_COMPRESSED - 1
+
+def _recv_exact(sock, num_bytes):
+    """Reads exactly num_bytes. Returns None if the peer closed before sending anything."""
+    buffer = bytearray(num_bytes)
+    view = memoryview(buffer)
+    # No MSG_WAITALL here (unlike the server): client sockets always have a
+    # timeout, which makes them non-blocking underneath, and Windows rejects
+    # the flag on those.
+    received = 0
+    while received < num_bytes:
+        n = sock.recv_into(view[received:], num_bytes - received)
+        if n == 0:
+            if received == 0:
+                return None
+            raise ConnectionError(f"Connection closed after {received} of {num_bytes} bytes.")
+        received += n
+    return buffer
+
+def _recv_framed(sock):
+    """Returns (payload, peer_accepts_compressed). payload is None if the peer closed."""
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None, False
+    (word,) = _FRAME_HEADER.unpack(header)
+    length = word & _FRAME_LENGTH_MASK
+    payload = _recv_exact(sock, length)
+    if payload is None and length > 0:
+        raise ConnectionError("Connection closed before the message body was received.")
+    if word & _FLAG_COMPRESSED:
+        if zstandard is None:
+            raise ConnectionError("Received a zstd-compressed message but 'zstandard' is not installed.")
+        try:
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        except zstandard.ZstdError as e:
+            # The frame was read completely, so the stream is still in sync.
+            raise ValueError(f"Could not decompress message: {e}") from e
+    return payload, bool(word & _FLAG_ACCEPTS_COMPRESSED)
+
+def _send_framed(sock, payload, compress=False):
+    """Sends one message, compressed with zstd if requested and available."""
+    flags = 0
+    if zstandard is not None:
+        flags |= _FLAG_ACCEPTS_COMPRESSED
+        if compress:
+            payload = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+            flags |= _FLAG_COMPRESSED
+    if len(payload) > _FRAME_LENGTH_MASK:
+        raise ValueError(f"Message of {len(payload)} bytes is too large to frame.")
+    sock.sendall(_FRAME_HEADER.pack(len(payload) | flags) + payload)
+
+def _tune_socket(sock):
+    # Large buffers for multi-megabyte responses; no Nagle delay on small writes.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
+class ServerConnection:
+    """
+    A persistent connection to one PFC server, shared by the worker threads.
+    The server runs one simulation at a time, so requests are serialized.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(CONNECTION_TIMEOUT)
+        _tune_socket(sock)
+        try:
+            sock.connect(self.server)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _drop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def request(self, payload):
+        """Sends one request and returns the response bytes."""
+        with self._lock:
+            while True:
+                reused = self._sock is not None
+                if not reused:
+                    self._sock = self._connect()
+                try:
+                    _send_framed(self._sock, payload)
+                    response, _ = _recv_framed(self._sock)
+                    if response is None:
+                        raise ConnectionError("Server closed the connection without a response.")
+                    return response
+                except socket.timeout:
+                    self._drop()
+                    raise
+                except OSError:
+                    # A kept-alive connection may have gone stale (e.g. the server
+                    # was restarted); retry once on a fresh one.
+                    self._drop()
+                    if not reused:
+                        raise
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    _send_framed(self._sock, json.dumps({"cmd": "quit"}).encode('utf-8'))
+                except OSError:
+                    pass
+            self._drop()
+
+SERVER_CONNECTIONS = {server: ServerConnection(server) for server in SERVER_LIST}
+
+class ServerUnavailableError(ConnectionError):
+    """Raised by a worker whose server could not be reached; the job can be retried."""
+
 def run_simulation_worker(params_list, server, target_case_dir, job_id):
     """
     This function is executed by each thread. It manages one full simulation run.
     """
-    params_dict = {p.name: v for p, v in zip(PARAMETER_SPACE, params_list)}
-
-    # Step A: Convert numpy types to native Python types
-    for key, value in params_dict.items():
-        if isinstance(value, np.integer):
-            params_dict[key] = int(value)
-        elif isinstance(value, np.floating):
-            params_dict[key] = float(value)
+    # Step A: Convert numpy types to native Python types (.item() on numpy scalars)
+    params_dict = {p.name: (v.item() if hasattr(v, 'item') else v)
+                   for p, v in zip(PARAMETER_SPACE, params_list)}
 
     # Step B: Format large numbers into scientific notation strings for PFC
-    params_dict_for_kb = params_dict.copy()
-    for key, value in params_dict_for_kb.items():
-        if isinstance(value, (int, float)) and abs(value) >= 1e6:
-            params_dict_for_kb[key] = f"{value:.6e}"
+    params_dict_for_kb = {k: (f"{v:.6e}" if isinstance(v, (int, float)) and abs(v) >= 1e6 else v)
+                          for k, v in params_dict.items()}
 
-    print(f"[Job {job_id}] Testing parameters on {server[0]}:{server[1]}")
+    logger.info("[Job %s] Testing parameters on %s:%s", job_id, server[0], server[1])
 
     # 1. Check knowledge base (cache) first
     sim_steps_json_string = load_from_knowledge_base(params_dict_for_kb)
 
     # 2. If not in cache, run the simulation on the PFC server
     if sim_steps_json_string is None:
-        print(f"[Job {job_id}] Cache miss. Connecting to PFC server...")
+        logger.info("[Job %s] Cache miss. Connecting to PFC server...", job_id)
         params_json_to_send = json.dumps(params_dict_for_kb)
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(CONNECTION_TIMEOUT)
-                s.connect(server)
-                s.sendall(params_json_to_send.encode('utf-8'))
-
-                fragments = []
-                while True:
-                    chunk = s.recv(1048576)
-                    if not chunk: break
-                    fragments.append(chunk)
-                
-                raw_response = b"".join(fragments).decode('utf-8').strip()
-
-                # --- FIX: Robustly parse the JSON response ---
-                # Find the first '{' and the last '}' to extract the main JSON object,
-                # ignoring any potential leading/trailing garbage data.
-                try:
-                    start = raw_response.find('{')
-                    end = raw_response.rfind('}')
-                    if start != -1 and end != -1:
-                        sim_steps_json_string = raw_response[start:end+1]
-                        response_data = json.loads(sim_steps_json_string)
-                        if "error" in response_data:
-                            print(f"[Job {job_id}] FAILED: Server returned an error: {response_data['error']}")
-                            sim_steps_json_string = None
-                        else:
-                            save_to_knowledge_base(params_dict_for_kb, sim_steps_json_string)
-                    else:
-                        raise json.JSONDecodeError("No valid JSON object found in response", raw_response, 0)
-                except json.JSONDecodeError as e:
-                    print(f"[Job {job_id}] FAILED: Could not parse JSON response from server. Error: {e}")
-                    sim_steps_json_string = None
-                # --- END FIX ---
-
-        except Exception as e:
-            print(f"[Job {job_id}] FAILED on server {server[0]}:{server[1]} with a network error: {e}")
-            sim_steps_json_string = None
+            response = SERVER_CONNECTIONS[server].request(params_json_to_send.encode('utf-8'))
+        except OSError as e:
+            logger.error("[Job %s] FAILED on server %s:%s with a network error: %s", job_id, server[0], server[1], e)
+            raise ServerUnavailableError(f"{server[0]}:{server[1]}: {e}") from e
+        except ValueError as e:
+            # e.g. a corrupt compressed response; the job fails like a bad simulation.
+            logger.error("[Job %s] FAILED: Could not decode response from server. Error: %s", job_id, e)
+            response = None
+
+        if response is not None:
+            try:
+                response_data = json.loads(response)
+                if "error" in response_data:
+                    logger.error("[Job %s] FAILED: Server returned an error: %s", job_id, response_data['error'])
+                else:
+                    sim_steps_json_string = response.decode('utf-8')
+                    save_to_knowledge_base(params_dict_for_kb, sim_steps_json_string)
+            except ValueError as e:
+                # JSONDecodeError, or UnicodeDecodeError for non-UTF-8 bytes
+                logger.error("[Job %s] FAILED: Could not parse JSON response from server. Error: %s", job_id, e)
+                sim_steps_json_string = None
+            except Exception as e:
+                logger.error("[Job %s] FAILED while handling the server response: %s", job_id, e)
+                sim_steps_json_string = None
 
     # 3. Calculate loss using the multi-step loss function
     if sim_steps_json_string is None:
-        print(f"[Job {job_id}] FAILED: No valid simulation data produced.")
+        logger.error("[Job %s] FAILED: No valid simulation data produced.", job_id)
         loss = 1e10
     else:
         loss = calculate_multi_step_loss(
@@ -139,20 +282,102 @@ def run_simulation_worker(params_list, server, target_case_dir, job_id):
             sim_transform=SIM_TRANSFORM,
             step_weights=STEP_WEIGHTS
         )
-        print(f"[Job {job_id}] SUCCEEDED with Total Weighted Loss = {loss:.6f}")
+        logger.info("[Job %s] SUCCEEDED with Total Weighted Loss = %.6f", job_id, loss)
 
     return params_list, loss, sim_steps_json_string, job_id
 
+def run_optimization_jobs(optimizer, target_case_dir, n_initial):
+    """
+    Runs simulation jobs until N_CALLS have been dispatched and all of them are
+    told to the optimizer. Each job goes to an idle server; a job whose server
+    fails is retried on a different server, and a server that fails
+    MAX_SERVER_FAILURES times in a row is retired.
+    """
+    healthy_servers = list(SERVER_LIST)
+    failure_counts = dict.fromkeys(SERVER_LIST, 0)
+    busy_servers = set()
+    # Points waiting for a server: (point, job id, retries left, server that failed it)
+    queued = deque()
+    futures = {}
+    total_jobs_dispatched = 0
+
+    def _queue_new_points(n_points):
+        nonlocal total_jobs_dispatched
+        n_points = min(n_points, N_CALLS - total_jobs_dispatched)
+        if n_points <= 0:
+            return
+        # One batch ask fills every free slot from the same model state.
+        for point in optimizer.ask(n_points):
+            total_jobs_dispatched += 1
+            queued.append((point, total_jobs_dispatched, JOB_RETRIES, None))
+
+    def _dispatch(executor):
+        for _ in range(len(queued)):
+            point, job_id, retries_left, failed_server = queued.popleft()
+            idle = [srv for srv in healthy_servers if srv not in busy_servers]
+            # A retry avoids the server it failed on unless no other is left.
+            if failed_server is not None and len(healthy_servers) > 1:
+                idle = [srv for srv in idle if srv != failed_server]
+            if not idle:
+                queued.append((point, job_id, retries_left, failed_server))
+                continue
+            server = idle[0]
+            busy_servers.add(server)
+            future = executor.submit(run_simulation_worker, point, server, target_case_dir, job_id)
+            futures[future] = (point, job_id, retries_left, server)
+            logger.info("--- Dispatched Job %s to %s:%s ---", job_id, server[0], server[1])
+
+    with ThreadPoolExecutor(max_workers=len(SERVER_LIST)) as executor:
+        _queue_new_points(n_initial)
+        _dispatch(executor)
+
+        # Block until at least one job finishes, tell the optimizer every
+        # finished result, then refill the idle servers with one batched ask.
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                point, job_id, retries_left, server = futures.pop(future)
+                busy_servers.discard(server)
+                try:
+                    x_result, y_result, _, completed_job_id = future.result()
+                    failure_counts[server] = 0
+                except ServerUnavailableError:
+                    failure_counts[server] += 1
+                    if failure_counts[server] >= MAX_SERVER_FAILURES and server in healthy_servers:
+                        healthy_servers.remove(server)
+                        logger.error("--- Server %s:%s failed %d times in a row; no more jobs go to it ---",
+                                     server[0], server[1], failure_counts[server])
+                    if retries_left > 0 and healthy_servers:
+                        queued.appendleft((point, job_id, retries_left - 1, server))
+                        logger.warning("--- Job %s will be retried on another server ---", job_id)
+                        continue
+                    x_result, y_result, completed_job_id = point, 1e10, job_id
+
+                optimizer.tell([x_result], [y_result])
+                logger.info("--- Optimizer updated with Job %s. Best loss so far: %.6f ---", completed_job_id, min(optimizer.yi))
+
+            if not healthy_servers:
+                logger.error("--- No PFC server is reachable; stopping this case ---")
+                break
+            n_idle = len([srv for srv in healthy_servers if srv not in busy_servers])
+            _queue_new_points(n_idle - len(queued))
+            _dispatch(executor)
+
 # =============================================================================
 # --- 3. MAIN EXECUTION BLOCK ---
 # =============================================================================
 
 if __name__ == '__main__':
+    # stdout, so log records stay in order with the progress banners.
+    logging.basicConfig(level=LOG_LEVEL, stream=sys.stdout,
+                        format='%(asctime)s %(threadName)s %(message)s')
+
     if not os.path.isdir(TARGET_DATA_ROOT_DIR):
         print(f"[FATAL ERROR] Target data root directory not found: '{TARGET_DATA_ROOT_DIR}'")
         exit()
 
-    target_cases = [d for d in os.listdir(TARGET_DATA_ROOT_DIR) if os.path.isdir(os.path.join(TARGET_DATA_ROOT_DIR, d))]
+    with os.scandir(TARGET_DATA_ROOT_DIR) as entries:
+        target_cases = [entry.name for entry in entries if entry.is_dir()]
     if not target_cases:
         print(f"[FATAL ERROR] No target case subdirectories found in '{TARGET_DATA_ROOT_DIR}'")
         exit()
@@ -168,7 +393,8 @@ if __name__ == '__main__':
         results_dir, curves_dir = setup_results_directory(case_name)
         print(f"Results for this run will be saved in: '{results_dir}'")
 
-        optimizer = Optimizer(dimensions=PARAMETER_SPACE, random_state=123)
+        optimizer = create_surrogate(SURROGATE, PARAMETER_SPACE, random_state=123,
+                                     n_initial_points=N_INITIAL_POINTS, strategy=ASK_STRATEGY)
 
         x_prior, y_prior = warm_start_optimizer(
             parameter_space=PARAMETER_SPACE,
@@ -181,37 +407,8 @@ if __name__ == '__main__':
             optimizer.tell(x_prior, y_prior)
             print(f"Optimizer warm-started with {len(x_prior)} prior points.")
 
-        num_workers = len(SERVER_LIST)
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            
-            n_initial = N_INITIAL_POINTS if not x_prior else num_workers
-            initial_points = optimizer.ask(n_points=n_initial)
-            
-            futures = {
-                executor.submit(run_simulation_worker, point, SERVER_LIST[i % num_workers], target_case_dir, i+1): point
-                for i, point in enumerate(initial_points)
-            }
-            total_jobs_dispatched = len(futures)
-            print(f"\n--- Dispatched initial batch of {len(futures)} jobs ---\n")
-
-            while total_jobs_dispatched < N_CALLS:
-                for future in as_completed(futures):
-                    x_result, y_result, _, completed_job_id = future.result()
-                    del futures[future]
-                    
-                    optimizer.tell([x_result], [y_result])
-                    print(f"--- Optimizer updated with Job {completed_job_id}. Best loss so far: {min(optimizer.yi):.6f} ---")
-                    
-                    if total_jobs_dispatched < N_CALLS:
-                        next_point = optimizer.ask()
-                        server_for_next_job = SERVER_LIST[total_jobs_dispatched % num_workers]
-                        total_jobs_dispatched += 1
-                        
-                        new_future = executor.submit(run_simulation_worker, next_point, server_for_next_job, target_case_dir, total_jobs_dispatched)
-                        futures[new_future] = next_point
-                        print(f"--- Dispatched new Job {total_jobs_dispatched} to {server_for_next_job[0]}:{server_for_next_job[1]} ---\n")
-                    
-                    break 
+        n_initial = N_INITIAL_POINTS if not x_prior else len(SERVER_LIST)
+        run_optimization_jobs(optimizer, target_case_dir, n_initial)
 
         result = optimizer.get_result()
         print("\n" + "-"*60)
@@ -229,6 +426,9 @@ if __name__ == '__main__':
         convergence_filepath = os.path.join(results_dir, "convergence_plot.png")
         plot_convergence(result, convergence_filepath)
 
+    for connection in SERVER_CONNECTIONS.values():
+        connection.close()
+
     print(f"\n\n{'='*60}")
     print("===            ALL TARGET CASES HAVE BEEN OPTIMIZED            ===")
     print("=" * 60)
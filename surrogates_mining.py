@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Surrogate (ask/tell) optimizers for the Multi-Step Mining Optimization.
+
+The client's scheduler only needs to ask for points, tell results, read the
+losses told so far and build a final result. SkoptSurrogate wraps the
+scikit-optimize GP optimizer used so far; OptunaSurrogate uses Optuna's TPE
+sampler, whose cost per tell does not grow cubically with the number of
+points, for long runs or large warm starts.
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+from skopt import Optimizer
+from skopt.space import Real, Integer, Categorical
+
+# Optuna is optional; only needed for SURROGATE = 'optuna'.
+try:
+    import optuna
+except ImportError:
+    optuna = None
+
+
+class Surrogate(ABC):
+    """Minimal ask/tell interface used by the client's scheduler."""
+
+    @abstractmethod
+    def ask(self, n_points):
+        """Returns a list of n_points parameter lists to evaluate next."""
+
+    @abstractmethod
+    def tell(self, xs, ys):
+        """Reports the losses ys of the parameter lists xs."""
+
+    @property
+    @abstractmethod
+    def yi(self):
+        """Losses told so far, in order."""
+
+    @abstractmethod
+    def get_result(self):
+        """Returns an OptimizeResult with x, fun, x_iters and func_vals."""
+
+
+class SkoptSurrogate(Surrogate):
+    """scikit-optimize Gaussian-process optimizer."""
+
+    def __init__(self, parameter_space, random_state=None, strategy='cl_min'):
+        self.optimizer = Optimizer(dimensions=parameter_space, random_state=random_state)
+        self.strategy = strategy
+
+    def ask(self, n_points):
+        # A batch ask uses constant-liar values for the pending points and
+        # refits a copy of the model per point, so a single point uses the
+        # plain ask().
+        if n_points > 1:
+            return self.optimizer.ask(n_points=n_points, strategy=self.strategy)
+        return [self.optimizer.ask()]
+
+    def tell(self, xs, ys):
+        self.optimizer.tell(xs, ys)
+
+    @property
+    def yi(self):
+        return self.optimizer.yi
+
+    def get_result(self):
+        return self.optimizer.get_result()
+
+
+class OptunaSurrogate(Surrogate):
+    """Optuna TPE sampler behind the same ask/tell interface."""
+
+    def __init__(self, parameter_space, random_state=None, n_initial_points=10):
+        if optuna is None:
+            raise ImportError("OptunaSurrogate requires the 'optuna' package.")
+        self.parameter_space = parameter_space
+        self.distributions = {dim.name: self._to_distribution(dim) for dim in parameter_space}
+        sampler = optuna.samplers.TPESampler(n_startup_trials=n_initial_points, seed=random_state)
+        self.study = optuna.create_study(direction='minimize', sampler=sampler)
+        self._pending = {}
+        self._xi = []
+        self._yi = []
+
+    @staticmethod
+    def _to_distribution(dim):
+        if isinstance(dim, Integer):
+            return optuna.distributions.IntDistribution(int(dim.low), int(dim.high))
+        if isinstance(dim, Real):
+            return optuna.distributions.FloatDistribution(
+                float(dim.low), float(dim.high), log=(dim.prior == 'log-uniform')
+            )
+        if isinstance(dim, Categorical):
+            return optuna.distributions.CategoricalDistribution(dim.categories)
+        raise TypeError(f"Unsupported dimension type: {type(dim).__name__}")
+
+    def ask(self, n_points):
+        points = []
+        for _ in range(n_points):
+            trial = self.study.ask(self.distributions)
+            point = [trial.params[dim.name] for dim in self.parameter_space]
+            self._pending[tuple(point)] = trial
+            points.append(point)
+        return points
+
+    def tell(self, xs, ys):
+        for x, y in zip(xs, ys):
+            trial = self._pending.pop(tuple(x), None)
+            if trial is not None:
+                self.study.tell(trial, y)
+            else:
+                # Points that were not asked for, e.g. from the knowledge base.
+                params = {dim.name: value for dim, value in zip(self.parameter_space, x)}
+                self.study.add_trial(optuna.trial.create_trial(
+                    params=params, distributions=self.distributions, value=y
+                ))
+            self._xi.append(list(x))
+            self._yi.append(y)
+
+    @property
+    def yi(self):
+        return self._yi
+
+    def get_result(self):
+        best = int(np.argmin(self._yi))
+        return OptimizeResult(
+            x=self._xi[best], fun=self._yi[best],
+            x_iters=self._xi, func_vals=np.asarray(self._yi),
+        )
+
+
+def create_surrogate(name, parameter_space, random_state=None, n_initial_points=10, strategy='cl_min'):
+    """Creates the surrogate selected by name: 'skopt' or 'optuna'."""
+    if name == 'skopt':
+        return SkoptSurrogate(parameter_space, random_state=random_state, strategy=strategy)
+    if name == 'optuna':
+        return OptunaSurrogate(parameter_space, random_state=random_state, n_initial_points=n_initial_points)
+    raise ValueError(f"Unknown surrogate '{name}'. Use 'skopt' or 'optuna'.")